@@ -195,10 +195,9 @@ def display_initial_schedule(
     init_availability_table = utils.display_availability(df)
 
     # Prepare forecast defaults
-    df_to_count = df.iloc[:num_full_time, :]
-    count = df_to_count.map(lambda cell: cell.count(REQUESTED_SHIFT_ICON)).sum()[1:].to_dict()
+    requested_count = (df.iloc[:num_full_time, 1:] == REQUESTED_SHIFT_ICON).sum()
     num_part_time = num_employees - num_full_time
-    count = [value + math.ceil(num_part_time / 2) for value in count.values()]
+    count = (requested_count + math.ceil(num_part_time / 2)).tolist()
 
     return (
         init_availability_table,
@@ -309,8 +308,8 @@ def run_optimization(
     if run_click == 0 or ctx.triggered_id != "run-button":
         raise PreventUpdate
 
-    shifts = list(sched_df["props"]["data"][0].keys())
-    shifts.remove("Employee")
+    # the first table column is always "Employee", the rest are the shifts in order
+    shifts = [column["id"] for column in sched_df["props"]["columns"][1:]]
 
     availability = utils.availability_to_dict(sched_df["props"]["data"])
     employees = list(availability.keys())
@@ -337,7 +336,7 @@ def run_optimization(
     sample = sampleset.first.sample
 
     sched = utils.build_schedule_from_sample(sample, employees)
-    scheduled_count = sched.map(lambda cell: UNAVAILABLE_ICON not in cell).sum()[1:].to_dict()
+    scheduled_count = (sched.iloc[:, 1:] != UNAVAILABLE_ICON).sum().to_dict()
 
     return (
         utils.display_schedule(sched, availability),
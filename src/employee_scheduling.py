@@ -11,13 +11,41 @@
 #    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
+from __future__ import annotations
+
 from collections import defaultdict
+from itertools import combinations
 
-from dimod import Binary, BinaryQuadraticModel, ConstrainedQuadraticModel, quicksum
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from dimod import BinaryQuadraticModel, ConstrainedQuadraticModel
 from dwave.system import LeapHybridCQMSampler
 
 from src.utils import DAYS, FULL_TIME_SHIFTS, SHIFTS
 
+# Maximum number of errors reported under each heading, and in total, when no feasible solution
+# is found; any further errors are summarized by a count under their heading
+MAX_ERRORS_PER_HEADING = 20
+MAX_ERRORS = 200
+
+# Error headings and messages for each constraint label key
+MSGS = {
+    "overtime": ("Employees with scheduled overtime", "{employee}"),
+    "insufficient": ("Employees with not enough scheduled time", "{employee}"),
+    "understaffed": ("Understaffed shifts", "{day} is understaffed"),
+    "overstaffed": ("Overstaffed shifts", "{day} is overstaffed"),
+    "isolated": ("Isolated shifts", "{day} is an isolated day off for {employee}"),
+    "manager_issue": ("Shifts with no manager", "No manager scheduled on {day}"),
+    "too_many_consecutive": (
+        "Employees with too many consecutive shifts",
+        "{employee} starting with {day}",
+    ),
+    "trainee_issue": (
+        "Shifts with trainee scheduling issues",
+        "Trainee scheduling issue on {day}",
+    ),
+}
+
 
 def build_cqm(
     availability: dict,
@@ -46,136 +74,198 @@ def build_cqm(
     """
     cqm = ConstrainedQuadraticModel()
     employees = list(availability.keys())
-    employees_ft = employees[:num_full_time]
-    employees_pt = employees[num_full_time:]
-
-    # Create variables: one per employee per shift
-    x = {
-        (employee, shift): Binary(employee + "_" + shift)
-        for shift in shifts
-        for employee in employees
-    }
+    employees_ft = range(num_full_time)
+    employees_pt = range(num_full_time, len(employees))
+    rows = {employee: e for e, employee in enumerate(employees)}  # row of each employee
+    names = np.array(employees)
+    managers = np.flatnonzero(np.char.endswith(names, "-Mgr"))
+    trainees = np.flatnonzero(np.char.endswith(names, "-Tr"))
+
+    # (employee, shift) grid of 0 (unavailable), 1 (available) and 2 (preferred)
+    avail = np.array(list(availability.values()), dtype=np.int8)
+
+    # Create variables: one per employee per available shift, laid out as an (employee, shift)
+    # grid so that an employee's shifts are a row and a shift's employees are a column
+    # Only schedule employees when they're available: unavailable shifts are left out of the
+    # model (None in the grid) rather than fixed to 0 by one equality constraint each
+    labels = np.array(
+        [[employee + "_" + shift for shift in shifts] for employee in employees], dtype=object
+    )
+    labels[avail == 0] = None
+    cqm.add_variables("BINARY", labels.T[avail.T != 0].tolist())
 
     # OBJECTIVES:
     # Objective: give employees preferred schedules (val = 2)
     obj = BinaryQuadraticModel(vartype="BINARY")
-    for employee, schedule in availability.items():
-        for i, shift in enumerate(shifts):
-            if schedule[i] == 2:
-                obj += -x[employee, shift]
+    obj.add_linear_from((v, -1) for v in labels[avail == 2])
 
     # Objective: for infeasible solutions, focus on right number of shifts for employees
+    # (sum(x) - target)**2 is expanded directly, using x*x = x for binary variables
     num_s = (min_shifts + max_shifts) / 2
-    for employee in employees_pt:
-        obj += (quicksum(x[employee, shift] for shift in shifts) - num_s) ** 2
-    for employee in employees_ft:
-        obj += (quicksum(x[employee, shift] for shift in shifts) - FULL_TIME_SHIFTS) ** 2
+    targets = np.where(np.arange(len(employees)) < num_full_time, FULL_TIME_SHIFTS, num_s)
+    linear = np.broadcast_to((1 - 2 * targets)[:, np.newaxis], labels.shape)
+    obj.add_linear_from(zip(labels[avail != 0], linear[avail != 0].tolist()))
+    obj.offset += float(np.square(targets).sum())
+    for row in labels:
+        variables = [v for v in row if v is not None]
+        obj.add_quadratic_from((u, v, 2) for u, v in combinations(variables, 2))
     cqm.set_objective(obj)
 
     # CONSTRAINTS:
-    # Only schedule employees when they're available
-    for employee, schedule in availability.items():
-        for i, shift in enumerate(shifts):
-            if schedule[i] == 0:
-                cqm.add_constraint(x[employee, shift] == 0, label=f"unavailable,{employee},{shift}")
+    # constraints are built from lists of (variable, bias) and (u, v, bias) terms rather than
+    # through Binary arithmetic, which creates an intermediate BQM for every operation; terms
+    # on unavailable shifts are dropped, as those variables are always 0
+
+    for e in employees_pt:
+        shift_count = [(v, 1) for v in labels[e] if v is not None]
 
-    for employee in employees_pt:
         # Schedule employees for at most max_shifts
-        cqm.add_constraint(
-            quicksum(x[employee, shift] for shift in shifts) <= max_shifts,
-            label=f"overtime,{employee},",
+        cqm.add_constraint_from_iterable(
+            shift_count, "<=", max_shifts, label=f"overtime,{employees[e]},"
         )
 
         # Schedule employees for at least min_shifts
-        cqm.add_constraint(
-            quicksum(x[employee, shift] for shift in shifts) >= min_shifts,
-            label=f"insufficient,{employee},",
+        cqm.add_constraint_from_iterable(
+            shift_count, ">=", min_shifts, label=f"insufficient,{employees[e]},"
         )
 
-    for employee in employees_ft:
+    for e in employees_ft:
+        shift_count = [(v, 1) for v in labels[e] if v is not None]
+
         # Schedule employees for at most max_shifts
-        cqm.add_constraint(
-            quicksum(x[employee, shift] for shift in shifts) <= FULL_TIME_SHIFTS,
-            label=f"overtime,{employee},",
+        cqm.add_constraint_from_iterable(
+            shift_count, "<=", FULL_TIME_SHIFTS, label=f"overtime,{employees[e]},"
         )
 
-        cqm.add_constraint(
-            quicksum(x[employee, shift] for shift in shifts) >= FULL_TIME_SHIFTS,
-            label=f"insufficient,{employee},",
+        cqm.add_constraint_from_iterable(
+            shift_count, ">=", FULL_TIME_SHIFTS, label=f"insufficient,{employees[e]},"
         )
 
     # Every shift needs shift_min and shift_max employees working
-    for i, shift in enumerate(shifts):
-        cqm.add_constraint(
-            sum(x[employee, shift] for employee in employees) >= shift_forecast[i],
-            label=f"understaffed,,{shift}",
+    for s, shift in enumerate(shifts):
+        staff_count = [(v, 1) for v in labels[:, s] if v is not None]
+
+        cqm.add_constraint_from_iterable(
+            staff_count, ">=", shift_forecast[s], label=f"understaffed,,{shift}"
         )
-        cqm.add_constraint(
-            sum(x[employee, shift] for employee in employees) <= shift_forecast[i],
-            label=f"overstaffed,,{shift}",
+        cqm.add_constraint_from_iterable(
+            staff_count, "<=", shift_forecast[s], label=f"overstaffed,,{shift}"
         )
 
     # Days off must be consecutive
     if not allow_isolated_days_off:
         # middle range shifts - pattern 101 penalized
-        for i, prev_shift in enumerate(shifts[:-2]):
-            shift = shifts[i + 1]
-            next_shift = shifts[i + 2]
-            for employee in employees_pt:
-                cqm.add_constraint(
-                    -3 * x[employee, shift]
-                    + x[employee, prev_shift] * x[employee, shift]
-                    + x[employee, shift] * x[employee, next_shift]
-                    + x[employee, prev_shift] * x[employee, next_shift]
-                    <= 0,
+        # shifted column views of the part-time block give every (prev, shift, next) triple
+        part_time = labels[num_full_time:]
+        windows = zip(part_time[:, :-2].T, part_time[:, 1:-1].T, part_time[:, 2:].T)
+        for shift, (prev_vars, mid_vars, next_vars) in zip(shifts[1:-1], windows):
+            for employee, prev_var, var, next_var in zip(
+                employees[num_full_time:], prev_vars, mid_vars, next_vars
+            ):
+                terms = [
+                    (var, -3),
+                    (prev_var, var, 1),
+                    (var, next_var, 1),
+                    (prev_var, next_var, 1),
+                ]
+                cqm.add_constraint_from_iterable(
+                    [term for term in terms if None not in term],
+                    "<=",
+                    0,
                     label=f"isolated,{employee},{shift}",
                 )
 
     # Require a manager on every shift
-    managers = [employee for employee in employees if employee[-3:] == "Mgr"]
-    for shift in shifts:
-        cqm.add_constraint(
-            quicksum(x[manager, shift] for manager in managers) >= 1,
+    # the manager rows are gathered once and each shift's constraint reads one column
+    for shift, manager_vars in zip(shifts, labels[managers].T):
+        cqm.add_constraint_from_iterable(
+            [(v, 1) for v in manager_vars if v is not None],
+            ">=",
+            1,
             label=f"manager_issue,,{shift}",
         )
 
     # Don't exceed max_consecutive_shifts
-    for employee in employees_pt:
-        for s in range(len(shifts) - max_consecutive_shifts + 1):
-            cqm.add_constraint(
-                quicksum([x[employee, shifts[s + i]] for i in range(max_consecutive_shifts)])
-                <= max_consecutive_shifts - 1,
-                label=f"too_many_consecutive,{employee},{shifts[s]}",
-            )
+    # (no window fits, and so no constraint is needed, if it is longer than the schedule)
+    if max_consecutive_shifts <= len(shifts):
+        windows = sliding_window_view(labels[num_full_time:], max_consecutive_shifts, axis=1)
+        for employee, employee_windows in zip(employees[num_full_time:], windows):
+            for shift, window in zip(shifts, employee_windows):
+                cqm.add_constraint_from_iterable(
+                    [(v, 1) for v in window if v is not None],
+                    "<=",
+                    max_consecutive_shifts - 1,
+                    label=f"too_many_consecutive,{employee},{shift}",
+                )
 
     # Trainee must work on shifts with trainer
-    trainees = [employee for employee in employees if employee[-2:] == "Tr"]
-    for shift in shifts:
-        cqm.add_constraint(
-            x[trainees[0], shift] - x[trainees[0], shift] * x[trainees[0][:-3], shift] == 0,
+    trainee = trainees[0]
+    trainer = rows[employees[trainee][:-3]]
+    for s, shift in enumerate(shifts):
+        terms = [(labels[trainee, s], 1), (labels[trainer, s], -1)]
+        cqm.add_constraint_from_iterable(
+            [term for term in terms if None not in term],
+            "<=",
+            0,
             label=f"trainee_issue,,{shift}",
         )
 
     return cqm
 
 
-def run_cqm(cqm: ConstrainedQuadraticModel):
+def _label_error(label: str) -> tuple[str, str] | None:
+    """Translate a constraint label into its error heading and message.
+
+    Args:
+        label: Constraint label of the form "key,employee,day".
+
+    Returns:
+        tuple[str, str] | None: The error heading and formatted message, or ``None`` if
+            the label key is unknown.
+    """
+    key, *data = label.split(",")
+    try:
+        heading, error_msg = MSGS[key]
+    except KeyError:
+        # ignore any unknown constraint labels
+        return None
+
+    format_dict = dict(zip(["employee", "day"], data))
+
+    # translate day index into day of week and date
+    if format_dict["day"]:
+        index = int(format_dict["day"]) - 1
+        format_dict["day"] = f"{DAYS[index%7]} {SHIFTS[index]}"
+
+    return heading, error_msg.format(**format_dict)
+
+
+def run_cqm(
+    cqm: ConstrainedQuadraticModel,
+    sampler: LeapHybridCQMSampler | None = None,
+    max_errors_per_heading: int = MAX_ERRORS_PER_HEADING,
+    max_errors: int = MAX_ERRORS,
+):
     """Run the provided CQM on the Leap Hybrid CQM Sampler.
 
     Args:
         cqm: A Constrained Quadratic Model representing the problem.
+        sampler: The sampler to use. Defaults to a new ``LeapHybridCQMSampler``.
+        max_errors_per_heading: The maximum number of errors to report under each heading.
+        max_errors: The maximum number of errors to report in total. Errors left out by either
+            limit are counted in a final "…and N more" entry under their heading.
 
     Returns:
         sampleset: A set of feasible or infeasible solutions.
         errors: A dictionary of error types and the errors that occurred.
     """
-    sampler = LeapHybridCQMSampler()
+    if sampler is None:
+        sampler = LeapHybridCQMSampler()
 
     sampleset = sampler.sample_cqm(cqm)
-    feasible_sampleset = sampleset.filter(lambda row: row.is_feasible)
 
-    num_feasible = len(feasible_sampleset)
-    if num_feasible == 0:
+    # check the feasibility flags in one pass before filtering the samples row by row
+    if not sampleset.record.is_feasible.any():
         errors = defaultdict(list)
         sat_array = sampleset.first.is_satisfied
 
@@ -185,42 +275,30 @@ def run_cqm(cqm: ConstrainedQuadraticModel):
         if s_vals == {0.0}:
             sampleset.first.sample[list(cqm.variables)[0]] = 1.0
 
-        msgs = {
-            "unavailable": ("Employees scheduled when unavailable", "{employee} on {day}"),
-            "overtime": ("Employees with scheduled overtime", "{employee}"),
-            "insufficient": ("Employees with not enough scheduled time", "{employee}"),
-            "understaffed": ("Understaffed shifts", "{day} is understaffed"),
-            "overstaffed": ("Overstaffed shifts", "{day} is overstaffed"),
-            "isolated": ("Isolated shifts", "{day} is an isolated day off for {employee}"),
-            "manager_issue": ("Shifts with no manager", "No manager scheduled on {day}"),
-            "too_many_consecutive": (
-                "Employees with too many consecutive shifts",
-                "{employee} starting with {day}",
-            ),
-            "trainee_issue": (
-                "Shifts with trainee scheduling issues",
-                "Trainee scheduling issue on {day}",
-            ),
-        }
-        for i, _ in enumerate(sat_array):
-            if not sat_array[i]:
-                key, *data = sampleset.info["constraint_labels"][i].split(",")
-                try:
-                    heading, error_msg = msgs[key]
-                except KeyError:
-                    # ignore any unknown constraint labels
-                    continue
-
-                # constraint label should be of form "key,employee,day"
-                format_dict = dict(zip(["employee", "day"], data))
-
-                # translate day index into day of week and date
-                if format_dict["day"]:
-                    index = int(format_dict["day"]) - 1
-                    format_dict["day"] = f"{DAYS[index%7]} {SHIFTS[index]}"
-
-                errors[heading].append(error_msg.format(**format_dict))
+        constraint_labels = sampleset.info["constraint_labels"]
+
+        # only visit the violated constraints; once a limit is reached, errors are only counted
+        # and no longer formatted
+        num_violated = defaultdict(int)
+        num_reported = 0
+        for i in np.flatnonzero(np.logical_not(sat_array)):
+            label = constraint_labels[i]
+            key = label.split(",", 1)[0]
+            if key not in MSGS:
+                # ignore any unknown constraint labels
+                continue
+
+            heading = MSGS[key][0]
+            num_violated[heading] += 1
+            if num_violated[heading] <= max_errors_per_heading and num_reported < max_errors:
+                errors[heading].append(_label_error(label)[1])
+                num_reported += 1
+
+        for heading, count in num_violated.items():
+            num_left_out = count - len(errors[heading])
+            if num_left_out:
+                errors[heading].append(f"…and {num_left_out} more")
 
         return sampleset, errors
 
-    return feasible_sampleset, None
+    return sampleset.filter(lambda row: row.is_feasible), None
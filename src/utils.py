@@ -15,6 +15,7 @@
 import datetime
 import random
 import string
+from functools import lru_cache
 
 import numpy as np
 import pandas as pd
@@ -33,44 +34,141 @@ SHIFTS = [
     (START_DATE + datetime.timedelta(i)).strftime("%e").strip() for i in range(SCHEDULE_LENGTH)
 ]
 DAYS = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
+# The month and year at the start and end of the schedule
+MONTHS = [
+    START_DATE.strftime("%B %Y"),
+    (START_DATE + datetime.timedelta(SCHEDULE_LENGTH - 1)).strftime("%B %Y"),
+]
+# The column headers of the availability and schedule tables
+COLUMNS = [{"id": "Employee", "name": ["", "", "Employee"]}] + [
+    {"id": str(i + 1), "name": [MONTHS[0 if i < 7 else 1], DAYS[i % 7], c]}
+    for i, c in enumerate(SHIFTS)
+]
 WEEKEND_IDS = ["1", "7", "8", "14"]
 FULL_TIME_SHIFTS = 10
 
+# Weighted first names from Faker's person provider, the table Faker().first_name() draws from;
+# Faker is only built once here, as creating one loads all of its providers
+_FIRST_NAME_WEIGHTS = Faker().provider("faker.providers.person").first_names
+FIRST_NAMES = np.array(list(_FIRST_NAME_WEIGHTS))
+FIRST_NAME_PROBS = np.array(list(_FIRST_NAME_WEIGHTS.values())) / sum(_FIRST_NAME_WEIGHTS.values())
+
+# Availability table icons indexed by availability code
+AVAILABILITY_ICONS = np.array([UNAVAILABLE_ICON, " ", REQUESTED_SHIFT_ICON])
+
+# Schedule cell contents indexed by (scheduled, availability code)
+SCHEDULE_ICONS = np.array(
+    [
+        [UNAVAILABLE_ICON, "\r", "\r" + REQUESTED_SHIFT_ICON],
+        [UNAVAILABLE_ICON, " ", " " + REQUESTED_SHIFT_ICON],
+    ],
+    dtype=object,
+)
+
+# Conditional styles shared by the availability and schedule tables: odd rows and weekends
+TABLE_STYLE = [
+    {
+        "if": {"row_index": "odd"},
+        "backgroundColor": "#f5f5f5",
+    },
+    {
+        "if": {"column_id": WEEKEND_IDS},
+        "backgroundColor": "#E5E5E5",
+    },
+]
+
+# Per-column conditional styles for the availability table: unavailable and requested shifts
+UNAVAILABLE_STYLE = np.array(
+    [
+        {
+            "if": {
+                "filter_query": f"{{{col_id}}} = {UNAVAILABLE_ICON}",
+                "column_id": col_id,
+            },
+            "backgroundColor": "#FF7006",  # orange
+            "color": "white",
+        }
+        for col_id in COL_IDS
+    ]
+)
+REQUESTED_STYLE = np.array(
+    [
+        {
+            "if": {
+                "filter_query": f"{{{col_id}}} = {REQUESTED_SHIFT_ICON}",
+                "column_id": col_id,
+            },
+            "backgroundColor": "#008c82",  # teal
+            "color": "white",
+        }
+        for col_id in COL_IDS
+    ]
+)
+
+# Per-column conditional styles for the schedule table: scheduled shifts and requested shifts
+# that were not scheduled
+SCHEDULED_STYLE = np.array(
+    [
+        {
+            "if": {
+                "filter_query": f'{{{col_id}}} contains " "',
+                "column_id": col_id,
+            },
+            "backgroundColor": "#2a7de1",  # blue
+            "color": "white",
+        }
+        for col_id in COL_IDS
+    ]
+)
+MISSED_REQUEST_STYLE = np.array(
+    [
+        {
+            "if": {
+                "filter_query": f'{{{col_id}}} contains "\r" && {{{col_id}}} contains {REQUESTED_SHIFT_ICON}',
+                "column_id": col_id,
+            },
+            "backgroundImage": "linear-gradient(-45deg, #c7003860 10%, transparent 10%, transparent 20%,\
+                #c7003860 20%, #c7003860 30%, transparent 30%, transparent 40%, #c7003860 40%, #c7003860 50%,\
+                transparent 50%, transparent 60%, #c7003860 60%, #c7003860 70%, transparent 70%, transparent 80%,\
+                #c7003860 80%, #c7003860 90%, transparent 90%)",  # light red
+        }
+        for col_id in COL_IDS
+    ]
+)
+
 
 def get_random_string(length):
     """Generate a random string of a given length."""
-    letters = string.ascii_lowercase
-    result_str = "".join(random.choice(letters) for _ in range(length))
+    return "".join(random.choices(string.ascii_lowercase, k=length))
 
-    return result_str
 
+def get_random_names(num_employees, rng=None):
+    """Generate a list of names for the employees to be scheduled, drawn from rng if given."""
+    if rng is None:
+        rng = np.random.default_rng(RANDOM_SEED)
 
-def get_random_names(num_employees):
-    """Generate a list of names for the employees to be scheduled."""
-    fake = Faker()
     names = []
-    letters = string.ascii_uppercase
+    seen = set()  # the names drawn so far, for constant-time duplicate checks
+    letters = list(string.ascii_uppercase)
 
-    for i in range(num_employees):
-        n = fake.first_name()
-        li = random.choice(letters)
+    while len(names) < num_employees:
+        # draw all missing names in one batch, then redraw only for duplicates
+        missing = num_employees - len(names)
+        first = rng.choice(FIRST_NAMES, size=missing, p=FIRST_NAME_PROBS).tolist()
+        initials = rng.choice(letters, size=missing).tolist()
 
-        full_name = n + " " + li
-        while full_name in names:
-            n = fake.first_name()
-            li = random.choice(letters)
+        for n, li in zip(first, initials):
             full_name = n + " " + li
-
-        names.append(full_name)
+            if full_name not in seen:
+                seen.add(full_name)
+                names.append(full_name)
 
     return names
 
 
 def build_random_sched(num_employees, num_full_time):
     """Builds a random availability schedule for employees."""
-
-    if RANDOM_SEED:
-        np.random.seed(RANDOM_SEED)
+    rng = np.random.default_rng(RANDOM_SEED)
 
     full_time_schedule = np.array(
         [
@@ -93,96 +191,71 @@ def build_random_sched(num_employees, num_full_time):
         for i in range(r):
             full_time_breakdown[i] += 1
 
-        # Build full-time schedules
-        full_time_schedules = np.empty((0, len(COL_IDS)))
-        for i in range(len(full_time_breakdown)):
-            for j in range(full_time_breakdown[i]):
-                full_time_schedules = np.vstack(
-                    [full_time_schedules, np.roll(full_time_schedule, -options[i])]
-                )
+        # Build full-time schedules from the three rotations of the base schedule
+        rotations = np.array([np.roll(full_time_schedule, -option) for option in options])
 
         if num_full_time < num_managers:
-            all_full_time = (
-                np.array(  # Managers
-                    [np.roll(full_time_schedule, -options[i]) for i in range(num_full_time)]
-                ),
-            )
+            all_full_time = (rotations[:num_full_time],)  # Managers
         else:
             all_full_time = (
-                np.array(  # Managers
-                    [np.roll(full_time_schedule, -options[i]) for i in range(num_managers)]
-                ),
-                full_time_schedules,  # Remaining full-time
+                rotations[:num_managers],  # Managers
+                np.repeat(rotations, full_time_breakdown, axis=0),  # Remaining full-time
             )
 
-    all_part_time = np.random.choice(  # Part-time
-        [UNAVAILABLE_ICON, " ", REQUESTED_SHIFT_ICON],
-        size=(num_employees - num_full_time, len(COL_IDS)),
-        p=[0.1, 0.8, 0.1],
-    )
+    # Part-time: draw availability codes and look up their icons
+    codes = rng.choice(3, size=(num_employees - num_full_time, len(COL_IDS)), p=[0.1, 0.8, 0.1])
+    all_part_time = AVAILABILITY_ICONS[codes]
 
-    data = pd.DataFrame(
-        np.concatenate(
-            (
-                *all_full_time,
-                all_part_time
-            )
-        ) if all_full_time
-        else all_part_time,
-        columns=COL_IDS,
-    )
+    schedule = np.concatenate((*all_full_time, all_part_time)) if all_full_time else all_part_time
+    schedule[-1] = " "  # the trainee, added last, is available for every shift
 
-    employees = get_random_names(num_employees - 1)  # one less to account for trainee
+    employees = get_random_names(num_employees - 1, rng)  # one less to account for trainee
 
     for i in range(num_managers):
         employees[i] += "-Mgr"
 
     employees.append(employees[-1] + "-Tr")
 
-    data.insert(0, "Employee", employees)
-
-    data.loc[data.Employee == employees[-1], data.columns[1:]] = " "
-
-    return data
+    return pd.DataFrame(
+        np.column_stack((np.array(employees, dtype=object), schedule)),
+        columns=["Employee", *COL_IDS],
+    )
 
 
 def build_schedule_from_sample(sample, employees):
     """Builds a schedule from the sample returned."""
-    data = pd.DataFrame(columns=COL_IDS)
-    data.insert(0, "Employee", employees)
+    rows = {employee: i for i, employee in enumerate(employees)}
+    cols = {col_id: i for i, col_id in enumerate(COL_IDS)}
 
+    # shifts missing from the sample were left out of the model as unavailable
+    scheduled = np.zeros((len(employees), len(COL_IDS)), dtype=bool)
     for key, val in sample.items():
         row, col = key.split("_")
-        if val == 1.0:
-            data.loc[data["Employee"] == row, col] = " "
-        else:
-            data.loc[data["Employee"] == row, col] = UNAVAILABLE_ICON
+        scheduled[rows[row], cols[col]] = val == 1.0
 
-    return data
+    return pd.DataFrame(
+        np.column_stack(
+            (np.array(employees, dtype=object), np.where(scheduled, " ", UNAVAILABLE_ICON))
+        ),
+        columns=["Employee", *COL_IDS],
+    )
 
 
 def get_cols():
     """Gets information for column headers, including months and days."""
-    start_month = START_DATE.strftime("%B %Y")  # Get month and year
-    # Get month and year
-    end_month = (START_DATE + datetime.timedelta(SCHEDULE_LENGTH - 1)).strftime("%B %Y")
-    month_display = [start_month, end_month]
-
-    return [{"id": "Employee", "name": ["", "", "Employee"]}] + [
-        {"id": str(i + 1), "name": [month_display[0 if i < 7 else 1], DAYS[i % 7], c]}
-        for i, c in enumerate(SHIFTS)
-    ]
+    return COLUMNS
 
 
+@lru_cache(maxsize=4)
 def get_cell_styling(cols):
-    """Sets conditional cell styling."""
+    """Sets conditional cell styling for a tuple of column ids."""
     return [
         {
             "if": {"column_id": cols[0]},
             "minWidth": "170px",
         },
         {
-            "if": {"column_id": cols[1:]},
+            "if": {"column_id": list(cols[1:])},
             "minWidth": "45px",
             "width": "45px",
             "maxWidth": "45px",
@@ -190,51 +263,30 @@ def get_cell_styling(cols):
     ]
 
 
+def get_records(df):
+    """Converts a table of plain strings to the list of row dicts used by DataTable."""
+    columns = df.columns.tolist()
+    return [dict(zip(columns, row)) for row in df.to_numpy().tolist()]
+
+
 def display_availability(df):
     """Builds the visual display of employee availability."""
+    # only style the columns that hold each icon, so the table has fewer rules to evaluate
+    values = df[COL_IDS].to_numpy()
+    style_data_conditional = (
+        TABLE_STYLE
+        + UNAVAILABLE_STYLE[(values == UNAVAILABLE_ICON).any(axis=0)].tolist()
+        + REQUESTED_STYLE[(values == REQUESTED_SHIFT_ICON).any(axis=0)].tolist()
+    )
 
     datatable = dash_table.DataTable(
-        data=df.to_dict("records"),
+        data=get_records(df),
         columns=get_cols(),
         cell_selectable=False,
         editable=False,
         style_cell={"textAlign": "center"},
-        style_cell_conditional=get_cell_styling(df.columns),
-        style_data_conditional=[
-            {
-                "if": {"row_index": "odd"},
-                "backgroundColor": "#f5f5f5",
-            },
-        ]
-        + [
-            {
-                "if": {"column_id": weekend_id},
-                "backgroundColor": "#E5E5E5",
-            }
-            for weekend_id in WEEKEND_IDS
-        ]
-        + [
-            {
-                "if": {
-                    "filter_query": f"{{{col_id}}} = {UNAVAILABLE_ICON}",
-                    "column_id": col_id,
-                },
-                "backgroundColor": "#FF7006",  # orange
-                "color": "white",
-            }
-            for col_id in COL_IDS
-        ]
-        + [
-            {
-                "if": {
-                    "filter_query": f"{{{col_id}}} = {REQUESTED_SHIFT_ICON}",
-                    "column_id": col_id,
-                },
-                "backgroundColor": "#008c82",  # teal
-                "color": "white",
-            }
-            for col_id in COL_IDS
-        ],
+        style_cell_conditional=get_cell_styling(tuple(df.columns)),
+        style_data_conditional=style_data_conditional,
         merge_duplicate_headers=True,
     )
 
@@ -243,59 +295,36 @@ def display_availability(df):
 
 def display_schedule(df, availability):
     """Builds the visual schedule for display."""
-    # mark all unscheduled days with an invisible character
-    df[df.iloc[:, 1:] == UNAVAILABLE_ICON] = "\r"
-    for employee_name, employee_availability in availability.items():
-        for i, col_id in enumerate(COL_IDS):
-            if employee_availability[i] == 0:  # not available
-                df.loc[df["Employee"] == employee_name, col_id] = UNAVAILABLE_ICON
-            elif employee_availability[i] == 2:  # available
-                df.loc[df["Employee"] == employee_name, col_id] += REQUESTED_SHIFT_ICON
+    scheduled = df[COL_IDS].to_numpy() != UNAVAILABLE_ICON
+    # availability codes aligned with the rows of df; employees without any leave cells unchanged
+    codes = np.array(
+        [availability.get(employee, [1] * len(COL_IDS)) for employee in df["Employee"]],
+        dtype=np.int8,
+    ).reshape(scheduled.shape)
+
+    # look up each cell by (scheduled, availability code); unscheduled days are marked with an
+    # invisible character
+    cells = SCHEDULE_ICONS[scheduled.astype(np.int8), codes]
+
+    # only style the columns with scheduled shifts or with requests that were not scheduled
+    style_data_conditional = (
+        TABLE_STYLE
+        + SCHEDULED_STYLE[scheduled.any(axis=0)].tolist()
+        + MISSED_REQUEST_STYLE[(~scheduled & (codes == 2)).any(axis=0)].tolist()
+    )
 
     datatable = dash_table.DataTable(
-        data=df.to_dict("records"),
+        # records are built from the cells directly, leaving df untouched
+        data=[
+            {"Employee": employee, **dict(zip(COL_IDS, row))}
+            for employee, row in zip(df["Employee"].tolist(), cells.tolist())
+        ],
         columns=get_cols(),
         cell_selectable=False,
         editable=False,
         style_cell={"textAlign": "center"},
-        style_cell_conditional=get_cell_styling(df.columns),
-        style_data_conditional=[
-            {
-                "if": {"row_index": "odd"},
-                "backgroundColor": "#f5f5f5",
-            },
-        ]
-        + [
-            {
-                "if": {"column_id": weekend_id},
-                "backgroundColor": "#E5E5E5",
-            }
-            for weekend_id in WEEKEND_IDS
-        ]
-        + [
-            {
-                "if": {
-                    "filter_query": f'{{{col_id}}} contains " "',
-                    "column_id": col_id,
-                },
-                "backgroundColor": "#2a7de1",  # blue
-                "color": "white",
-            }
-            for col_id in COL_IDS
-        ]
-        + [
-            {
-                "if": {
-                    "filter_query": f'{{{col_id}}} contains "\r" && {{{col_id}}} contains {REQUESTED_SHIFT_ICON}',
-                    "column_id": col_id,
-                },
-                "backgroundImage": "linear-gradient(-45deg, #c7003860 10%, transparent 10%, transparent 20%,\
-                #c7003860 20%, #c7003860 30%, transparent 30%, transparent 40%, #c7003860 40%, #c7003860 50%,\
-                transparent 50%, transparent 60%, #c7003860 60%, #c7003860 70%, transparent 70%, transparent 80%,\
-                #c7003860 80%, #c7003860 90%, transparent 90%)",  # light red
-            }
-            for col_id in COL_IDS
-        ],
+        style_cell_conditional=get_cell_styling(tuple(df.columns)),
+        style_data_conditional=style_data_conditional,
         merge_duplicate_headers=True,
     )
 
@@ -303,14 +332,15 @@ def display_schedule(df, availability):
 
 
 def availability_to_dict(availability_list):
-    """Converts employee availability to a dictionary."""
-    availability_dict = {}
-
-    for row in availability_list:
-        availability_dict[row["Employee"]] = [
-            0 if row[col_id] == UNAVAILABLE_ICON
-            else 2 if row[col_id] == REQUESTED_SHIFT_ICON
-            else 1 for col_id in COL_IDS
-        ]
-
-    return availability_dict
+    """Converts employee availability, as table records or a DataFrame, to a dictionary."""
+    if isinstance(availability_list, pd.DataFrame):
+        employees = availability_list["Employee"].tolist()
+        cells = availability_list[COL_IDS].to_numpy()
+    else:
+        employees = [row["Employee"] for row in availability_list]
+        cells = np.array(
+            [[row[col_id] for col_id in COL_IDS] for row in availability_list], dtype=object
+        )
+    codes = np.where(cells == UNAVAILABLE_ICON, 0, np.where(cells == REQUESTED_SHIFT_ICON, 2, 1))
+
+    return dict(zip(employees, codes.tolist()))
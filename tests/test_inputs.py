@@ -11,13 +11,17 @@
 #    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
+import math
 import unittest
 
+import numpy as np
 from dash import dash_table
+from dimod import Binary, SampleSet, quicksum
 
 import src.employee_scheduling as employee_scheduling
 import src.utils as utils
 from demo_callbacks import display_initial_schedule
+from demo_configs import REQUESTED_SHIFT_ICON, UNAVAILABLE_ICON
 
 
 class TestDemo(unittest.TestCase):
@@ -29,7 +33,65 @@ class TestDemo(unittest.TestCase):
 
         self.assertEqual(len(sched_df), num_employees)
 
-    # Check that CQM created has the right number of variables
+        icons = {UNAVAILABLE_ICON, " ", REQUESTED_SHIFT_ICON}
+        for num_full_time in [0, 1, 2, 6]:
+            with self.subTest(num_full_time=num_full_time):
+                df = utils.build_random_sched(num_employees, num_full_time)
+                cells = df[utils.COL_IDS].to_numpy()
+
+                self.assertEqual(list(df.columns), ["Employee", *utils.COL_IDS])
+                self.assertEqual(len(df), num_employees)
+                self.assertTrue(set(cells.ravel()) <= icons)
+
+                # full-time employees request exactly FULL_TIME_SHIFTS shifts
+                requested = (cells[:num_full_time] == REQUESTED_SHIFT_ICON).sum(axis=1)
+                self.assertTrue((requested == utils.FULL_TIME_SHIFTS).all())
+
+                # the trainee has no preferences
+                self.assertTrue((cells[-1] == " ").all())
+
+    # Check the forecast defaults: requested full-time shifts plus half the part-time employees
+    def test_initial_forecast(self):
+        num_employees, num_full_time = 12, 6
+
+        outputs = display_initial_schedule(num_employees, num_full_time)
+        records = outputs[0].data
+        forecast = outputs[5]
+
+        part_time_share = math.ceil((num_employees - num_full_time) / 2)
+        expected = [
+            sum(row[col_id] == REQUESTED_SHIFT_ICON for row in records[:num_full_time])
+            + part_time_share
+            for col_id in utils.COL_IDS
+        ]
+        self.assertEqual(forecast, expected)
+        self.assertEqual(outputs[6], expected)
+        self.assertTrue(all(type(value) is int for value in forecast))
+
+    # Check that generated employee names are unique
+    def test_random_names(self):
+        names = utils.get_random_names(200)
+
+        self.assertEqual(len(names), 200)
+        self.assertEqual(len(set(names)), 200)
+
+    # Check that availability icons are converted to 0 (unavailable), 1 and 2 (requested)
+    def test_availability_to_dict(self):
+        row = {col_id: " " for col_id in utils.COL_IDS}
+        row.update({"Employee": "A", "1": UNAVAILABLE_ICON, "2": REQUESTED_SHIFT_ICON})
+
+        availability = utils.availability_to_dict([row, {**row, "Employee": "B", "1": " "}])
+
+        self.assertEqual(availability["A"], [0, 2] + [1] * (len(utils.COL_IDS) - 2))
+        self.assertEqual(availability["B"], [1, 2] + [1] * (len(utils.COL_IDS) - 2))
+        self.assertIsInstance(availability["A"][0], int)
+
+        df = utils.build_random_sched(8, 4)
+        self.assertEqual(
+            utils.availability_to_dict(df), utils.availability_to_dict(df.to_dict("records"))
+        )
+
+    # Check that CQM created has one variable per available shift
     def test_cqm(self):
         num_employees = 12
         shift_forecast = [9, 8, 8, 8, 8, 8, 9, 9, 8, 8, 8, 8, 8, 9]
@@ -43,7 +105,9 @@ class TestDemo(unittest.TestCase):
             availability, shifts, 5, 10, shift_forecast, False, 6, 6
         )
 
-        self.assertEqual(len(cqm.variables), num_employees * len(shifts))
+        num_available = sum(bool(val) for schedule in availability.values() for val in schedule)
+        self.assertEqual(len(cqm.variables), num_available)
+        self.assertFalse(any(label.startswith("unavailable") for label in cqm.constraints))
 
     def test_samples(self):
         shifts = [str(i + 1) for i in range(5)]
@@ -183,3 +247,182 @@ class TestDemo(unittest.TestCase):
 
         # This should verify we don't have any issues in the object created for display from a sample
         self.assertEqual(type(disp_datatable), dash_table.DataTable)
+
+        # Shifts left out of the model as unavailable are not scheduled
+        del sample["C_5"]
+        sched = utils.build_schedule_from_sample(sample, employees)
+        self.assertEqual(sched.loc[sched["Employee"] == "C", "5"].item(), UNAVAILABLE_ICON)
+        self.assertEqual(sched.loc[sched["Employee"] == "C", "4"].item(), " ")
+        self.assertEqual(sched.loc[sched["Employee"] == "A-Mgr", "1"].item(), UNAVAILABLE_ICON)
+        self.assertEqual(sched.columns.tolist(), ["Employee"] + utils.COL_IDS)
+
+    # Check that icon styles are only emitted for the columns that hold the icon
+    def test_display_styles(self):
+        employees = ["A-Mgr", "A-Tr"]
+        sample = {f"{employee}_{col_id}": 0.0 for employee in employees for col_id in utils.COL_IDS}
+        sample["A-Mgr_3"] = 1.0
+        availability = {employee: [1] * len(utils.COL_IDS) for employee in employees}
+        availability["A-Tr"][4] = 2
+
+        datatable = utils.display_schedule(
+            utils.build_schedule_from_sample(sample, employees), availability
+        )
+
+        styled = [
+            rule["if"]["column_id"]
+            for rule in datatable.style_data_conditional
+            if "filter_query" in rule["if"]
+        ]
+        self.assertEqual(styled, ["3", "5"])
+
+    # Check that an isolated day off is only allowed when requested
+    def test_isolated_days_off(self):
+        shifts = [str(i + 1) for i in range(5)]
+        availability = {
+            "A-Mgr": [1] * 5,
+            "B-Mgr": [1] * 5,
+            "C": [1] * 5,
+            "C-Tr": [1] * 5,
+        }
+
+        cqm = employee_scheduling.build_cqm(availability, shifts, 1, 5, [2] * 5, False, 6, 0)
+
+        def isolated_violations(pattern):
+            sample = {v: 0 for v in cqm.variables}
+            sample.update({f"C_{shift}": val for shift, val in zip(shifts, pattern)})
+            violations = cqm.violations(sample, skip_satisfied=False)
+            return [
+                label
+                for label, violation in violations.items()
+                if label.startswith("isolated,C,") and violation > 0
+            ]
+
+        self.assertEqual(isolated_violations([1, 0, 1, 0, 0]), ["isolated,C,2"])
+        self.assertEqual(isolated_violations([1, 1, 0, 0, 0]), [])
+
+        cqm = employee_scheduling.build_cqm(availability, shifts, 1, 5, [2] * 5, True, 6, 0)
+        self.assertFalse(any(label.startswith("isolated") for label in cqm.constraints))
+
+    # Check that the trainee constraints are linear and only flag shifts worked without the trainer
+    def test_trainee_with_trainer(self):
+        shifts = [str(i + 1) for i in range(3)]
+        availability = {
+            "A-Mgr": [1] * 3,
+            "C": [1] * 3,
+            "C-Tr": [1] * 3,
+        }
+
+        cqm = employee_scheduling.build_cqm(availability, shifts, 1, 3, [2] * 3, True, 6, 0)
+
+        for shift in shifts:
+            self.assertFalse(cqm.constraints[f"trainee_issue,,{shift}"].lhs.quadratic)
+
+        sample = {v: 0 for v in cqm.variables}
+        sample.update({"C-Tr_1": 1, "C_1": 1, "C-Tr_2": 1, "C_3": 1})
+        violations = cqm.violations(sample, skip_satisfied=False)
+        flagged = [
+            label
+            for label, violation in violations.items()
+            if label.startswith("trainee_issue") and violation > 0
+        ]
+        self.assertEqual(flagged, ["trainee_issue,,2"])
+
+    # Check that the expanded objective matches (sum(x) - target)**2 built from Binary variables
+    def test_objective(self):
+        shifts = [str(i + 1) for i in range(5)]
+        availability = {
+            "A-Mgr": [1, 2, 2, 1, 0],
+            "B-Mgr": [2, 1, 1, 0, 1],
+            "C": [1, 1, 2, 1, 1],
+            "C-Tr": [1] * 5,
+        }
+        min_shifts, max_shifts, num_full_time = 1, 6, 1
+
+        cqm = employee_scheduling.build_cqm(
+            availability, shifts, min_shifts, max_shifts, [2] * 5, False, 6, num_full_time
+        )
+
+        x = {(e, s): Binary(f"{e}_{s}") for e in availability for s in shifts}
+        expected = -quicksum(
+            x[e, s]
+            for e, schedule in availability.items()
+            for s, preference in zip(shifts, schedule)
+            if preference == 2
+        )
+        for i, employee in enumerate(availability):
+            target = utils.FULL_TIME_SHIFTS if i < num_full_time else (min_shifts + max_shifts) / 2
+            expected += (quicksum(x[employee, s] for s in shifts) - target) ** 2
+
+        rng = np.random.default_rng(42)
+        for _ in range(20):
+            sample = {v: int(rng.integers(2)) for v in cqm.variables}
+            # unavailable shifts are left out of the model and are never worked
+            full_sample = {v: sample.get(v, 0) for v in expected.variables}
+            self.assertAlmostEqual(cqm.objective.energy(sample), expected.energy(full_sample))
+
+    # Check that errors are reported for the violated constraints of an infeasible sample
+    def test_run_cqm_errors(self):
+        shifts = [str(i + 1) for i in range(5)]
+        availability = {
+            "A-Mgr": [1] * 5,
+            "B-Mgr": [1] * 5,
+            "C": [1, 0, 1, 1, 1],
+            "C-Tr": [1] * 5,
+        }
+
+        cqm = employee_scheduling.build_cqm(availability, shifts, 1, 5, [3] * 5, False, 6, 0)
+
+        class StubSampler:
+            def sample_cqm(self, cqm):
+                # C and the trainee work every available shift, the managers are never scheduled
+                sample = {v: 0 if "Mgr" in v else 1 for v in cqm.variables}
+                sampleset = SampleSet.from_samples_cqm(sample, cqm)
+                sampleset.info["constraint_labels"] = list(cqm.constraints)
+                return sampleset
+
+        sampleset, errors = employee_scheduling.run_cqm(cqm, sampler=StubSampler())
+
+        days = [f"{utils.DAYS[i % 7]} {utils.SHIFTS[i]}" for i in range(len(shifts))]
+        self.assertFalse(sampleset.first.is_feasible)
+        self.assertEqual(
+            dict(errors),
+            {
+                "Employees with not enough scheduled time": ["A-Mgr", "B-Mgr"],
+                "Understaffed shifts": [f"{day} is understaffed" for day in days],
+                "Isolated shifts": [f"{days[1]} is an isolated day off for C"],
+                "Shifts with no manager": [f"No manager scheduled on {day}" for day in days],
+                "Shifts with trainee scheduling issues": [f"Trainee scheduling issue on {days[1]}"],
+            },
+        )
+
+        # errors over the limits are summarized by a count under their heading
+        _, errors = employee_scheduling.run_cqm(
+            cqm, sampler=StubSampler(), max_errors_per_heading=2
+        )
+        self.assertEqual(errors["Employees with not enough scheduled time"], ["A-Mgr", "B-Mgr"])
+        self.assertEqual(
+            errors["Understaffed shifts"],
+            [f"{day} is understaffed" for day in days[:2]] + ["…and 3 more"],
+        )
+
+        _, errors = employee_scheduling.run_cqm(cqm, sampler=StubSampler(), max_errors=3)
+        num_reported = sum(not msg.startswith("…") for msgs in errors.values() for msg in msgs)
+        self.assertEqual(num_reported, 3)
+        self.assertEqual(errors["Shifts with no manager"], ["…and 5 more"])
+
+    # Check one consecutive-shift constraint per part-time window, and none if no window fits
+    def test_consecutive_shifts(self):
+        shifts = [str(i + 1) for i in range(4)]
+        availability = {"A-Mgr": [1] * 4, "B": [1] * 4, "B-Tr": [1] * 4}
+
+        def consecutive_labels(max_consecutive_shifts):
+            cqm = employee_scheduling.build_cqm(
+                availability, shifts, 1, 3, [1] * 4, True, max_consecutive_shifts, 1
+            )
+            return [label for label in cqm.constraints if label.startswith("too_many_consecutive")]
+
+        self.assertEqual(
+            consecutive_labels(3),
+            [f"too_many_consecutive,{e},{s}" for e in ["B", "B-Tr"] for s in ["1", "2"]],
+        )
+        self.assertEqual(consecutive_labels(5), [])